@@ -5,6 +5,16 @@ import re
 
 from django.utils import six
 
+# SphinxQL operators and keywords are prefixed with three backslashes: one
+# escapes operator in MATCH expression, two more survive string literal
+# quoting.
+_SPHINX_OPERATORS = u'=<>()|!@~&/^$-\'"\\'
+_ESCAPE_TABLE = {ord(c): u'\\\\\\' + c for c in _SPHINX_OPERATORS}
+_ESCAPE_RE = re.compile(r"([=<>()|!@~&/^$\-\'\"\\])")
+_KEYWORDS_RE = re.compile(r'\b(SENTENCE|PARAGRAPH)\b')
+_NEEDS_ESCAPE_RE = re.compile(
+    r"[=<>()|!@~&/^$\-\'\"\\]|\b(?:SENTENCE|PARAGRAPH)\b")
+
 
 def sphinx_escape(value):
     """ Escapes SphinxQL search expressions. """
@@ -12,6 +22,14 @@ def sphinx_escape(value):
     if not isinstance(value, six.string_types):
         return value
 
-    value = re.sub(r"([=<>()|!@~&/^$\-\'\"\\])", r'\\\\\\\1', value)
-    value = re.sub(r'\b(SENTENCE|PARAGRAPH)\b', r'\\\\\\\1', value)
+    if not _NEEDS_ESCAPE_RE.search(value):
+        # most search expressions are plain words
+        return value
+
+    if isinstance(value, six.text_type):
+        value = value.translate(_ESCAPE_TABLE)
+    else:
+        # python2 byte strings could not be translated with mapping
+        value = _ESCAPE_RE.sub(r'\\\\\\\1', value)
+    value = _KEYWORDS_RE.sub(r'\\\\\\\1', value)
     return value
@@ -78,6 +78,7 @@ WSGI_APPLICATION = 'testproject.wsgi.application'
 SPHINX_DATABASE_NAME = 'default'
 
 import pymysql
+from pymysql.constants import CLIENT
 pymysql.install_as_MySQLdb()
 
 DATABASES = {
@@ -85,6 +86,10 @@ DATABASES = {
         'ENGINE': 'sphinxsearch.backend.sphinx',
         'HOST': '127.0.0.1',
         'PORT': 9307,
+        'OPTIONS': {
+            # allow SELECT ...; SHOW META batches
+            'client_flag': CLIENT.FOUND_ROWS | CLIENT.MULTI_STATEMENTS,
+        }
     }
 }
 
@@ -1,123 +1,261 @@
 # coding: utf-8
 
 # $Id: $
+import functools
+import itertools
+import os
 import sys
 from datetime import datetime, timedelta
+from multiprocessing.pool import ThreadPool
 
 from django.conf import settings
 from django.db import connections
 from django.db.models import Sum, Q
+from django.db.models.sql import InsertQuery
 from django.db.utils import ProgrammingError
 from django.test import TransactionTestCase
 from django.test.utils import CaptureQueriesContext
 from unittest import expectedFailure
 
+from sphinxsearch.fields import SphinxField
 from sphinxsearch.utils import sphinx_escape
 from testapp import models
 from sphinxsearch.routers import SphinxRouter
 
 
-class SphinxModelTestCaseBase(TransactionTestCase):
-    _id = 0
+# Set SPX_TEST_TRACE environment variable to print SphinxQL queries executed
+# by each test.
+TRACE_QUERIES = bool(os.environ.get('SPX_TEST_TRACE'))
+
+
+def mutates_baseline(func):
+    """ Marks test that changes baseline document, so it is re-created after
+    test finishes."""
+    func.mutates_baseline = True
+    return func
 
+
+class SphinxModelTestCaseBase(TransactionTestCase):
     model = models.TestModel
 
+    # Baseline document attributes; id and attr_timestamp are set in
+    # get_model_defaults()
+    _defaults_template = {
+        'id': None,
+        'sphinx_field': "hello sphinx field",
+        'attr_uint': 100500,
+        'attr_bool': True,
+        'attr_bigint': 2 ** 33,
+        'attr_float': 1.2345,
+        'attr_multi': (1, 2, 3),
+        'attr_multi_64': (2 ** 33, 2 ** 34),
+        'attr_timestamp': None,
+        'attr_string': "hello sphinx attr",
+        "attr_json": {"json": "test"},
+    }
+
     def _fixture_teardown(self):
         # Prevent SHOW FULL TABLES call
         pass
 
-    def truncate_model(self):
+    def _should_reload_connections(self):
+        # Keep searchd connection open between tests, there is no session
+        # state to reset, and reconnecting costs a handshake per test
+        return False
+
+    @classmethod
+    def truncate_model(cls):
         c = connections[settings.SPHINX_DATABASE_NAME].cursor()
-        c.execute("TRUNCATE RTINDEX %s" % self.model._meta.db_table)
+        c.execute("TRUNCATE RTINDEX %s" % cls.model._meta.db_table)
         c.close()
 
-    def setUp(self):
+    @classmethod
+    def delete_documents(cls, ids):
+        """ Deletes documents from model index by document ids."""
+        if not ids:
+            return
+        c = connections[settings.SPHINX_DATABASE_NAME].cursor()
+        c.execute("DELETE FROM %s WHERE id IN (%s)" % (
+            cls.model._meta.db_table, ', '.join(map(str, ids))))
+        c.close()
+
+    @classmethod
+    def create_baseline(cls):
+        """ Truncates model index and inserts baseline document."""
+        cls.truncate_model()
+        cls.baseline = cls.get_model_defaults()
+        cls.baseline_obj = cls.model.objects.create(**cls.baseline)
+
+    @classmethod
+    def setUpClass(cls):
+        super(SphinxModelTestCaseBase, cls).setUpClass()
         c = connections[settings.SPHINX_DATABASE_NAME]
-        self.no_string_compare = c.mysql_version < (2, 2, 7)
-        self.truncate_model()
-        self.now = datetime.now().replace(microsecond=0)
-        self.defaults = self.get_model_defaults()
-        self.spx_queries = CaptureQueriesContext(
-            connections[settings.SPHINX_DATABASE_NAME])
-        self.spx_queries.__enter__()
-        self.obj = self.model.objects.create(**self.defaults)
-
-    def get_model_defaults(self):
-        return {
-            'id': self.newid(),
-            'sphinx_field': "hello sphinx field",
-            'attr_uint': 100500,
-            'attr_bool': True,
-            'attr_bigint': 2 ** 33,
-            'attr_float': 1.2345,
-            'attr_multi': [1, 2, 3],
-            'attr_multi_64': [2 ** 33, 2 ** 34],
-            'attr_timestamp': self.now,
-            'attr_string': "hello sphinx attr",
-            "attr_json": {"json": "test"},
-        }
+        cls.no_string_compare = c.mysql_version < (2, 2, 7)
+        cls.now = datetime.now().replace(microsecond=0)
+        cls.create_baseline()
+
+    def setUp(self):
+        self.defaults = dict(self.baseline)
+        self.obj = self.baseline_obj
+        # documents created by test get ids greater than this one
+        self._first_id = self.newid()
+        self.spx_queries = None
+        if TRACE_QUERIES:
+            self.spx_queries = CaptureQueriesContext(
+                connections[settings.SPHINX_DATABASE_NAME])
+            self.spx_queries.__enter__()
 
     @classmethod
-    def newid(cls):
-        cls._id += 1
-        return cls._id
+    def get_model_defaults(cls):
+        defaults = cls._defaults_template.copy()
+        defaults['id'] = cls.newid()
+        defaults['attr_timestamp'] = cls.now
+        # mutable values are fresh for each baseline document
+        defaults['attr_multi'] = list(defaults['attr_multi'])
+        defaults['attr_multi_64'] = list(defaults['attr_multi_64'])
+        defaults['attr_json'] = dict(defaults['attr_json'])
+        return defaults
+
+    # returns next document id, shared by all test cases
+    newid = staticmethod(functools.partial(next, itertools.count(1)))
+
+    @classmethod
+    def replace_objects(cls, objs):
+        """ Saves multiple objects with single REPLACE query.
+
+        Deferred fields except primary key are not saved, as with
+        Model.save().
+        """
+        meta = cls.model._meta
+        deferred = objs[0].get_deferred_fields()
+        fields = [f for f in meta.concrete_fields
+                  if f.attname not in deferred or f.primary_key]
+        query = InsertQuery(cls.model)
+        query.insert_values(fields, objs)
+        compiler = query.get_compiler(using=settings.SPHINX_DATABASE_NAME)
+        c = connections[settings.SPHINX_DATABASE_NAME].cursor()
+        for sql, params in compiler.as_sql():
+            c.execute(sql.replace('INSERT', 'REPLACE', 1), params)
+        c.close()
+
+    def create_multiple_models(self):
+        objs = [self.model(id=self.newid(),
+                           attr_json={},
+                           attr_uint=i,
+                           attr_timestamp=self.now)
+                for i in range(10)]
+        self.model.objects.bulk_create(objs)
+        return [self.obj.id] + [obj.id for obj in objs]
 
     def reload_object(self, obj):
         return obj._meta.model.objects.get(pk=obj.pk)
 
+    def reload_field(self, obj, field):
+        """ Reloads single field value of object."""
+        qs = obj._meta.model.objects.values_list(field, flat=True)
+        return qs.get(pk=obj.pk)
+
+    def reload_with_meta(self, obj):
+        """ Reloads object and fetches SHOW META in single batch request.
+
+        :return: reloaded object and query meta
+        :rtype: tuple
+        """
+        model = obj._meta.model
+        names = [f.attname for f in model._meta.concrete_fields
+                 if not isinstance(f, SphinxField)]
+        qs = model.objects.filter(id=obj.id).values_list(*names)
+        compiler = qs.query.get_compiler(using=qs.db)
+        sql, params = compiler.as_sql()
+        c = connections[settings.SPHINX_DATABASE_NAME].cursor()
+        try:
+            c.execute("%s; SHOW META" % sql, params)
+            rows = c.fetchall()
+            c.nextset()
+            meta = dict([c.fetchone()])
+        finally:
+            c.close()
+        values = dict(zip(names, next(compiler.results_iter([rows]))))
+        values[model._meta.pk.attname] = obj.pk
+        return model(**values), meta
+
+    def get_by_lookups(self, lookups):
+        """ Fetches object matching all lookups with single query.
+
+        If nothing is found, fails with first lookup not matching object.
+        """
+        try:
+            return self.model.objects.get(**lookups)
+        except self.model.DoesNotExist:
+            for key, value in lookups.items():
+                if not self.model.objects.filter(**{key: value}).count():
+                    self.fail("lookup failed for %s = %s" % (key, value))
+            raise
+
+    def parallel_lookups(self, query, lookups):
+        """ Runs independent read-only lookups concurrently.
+
+        :param query: callable accepting single lookup as keyword argument
+        :param lookups: lookup values by lookup name
+        :type lookups: dict
+        :return: query results by lookup name
+        :rtype: dict
+        """
+        def run(key):
+            try:
+                return query(**{key: lookups[key]})
+            finally:
+                # each thread uses its own searchd connection
+                connections[settings.SPHINX_DATABASE_NAME].close()
+
+        keys = list(lookups)
+        pool = ThreadPool(min(len(keys), 8))
+        try:
+            return dict(zip(keys, pool.map(run, keys)))
+        finally:
+            pool.close()
+            pool.join()
+
     def assertObjectEqualsToDefaults(self, other, defaults=None):
         defaults = defaults or self.defaults
-        result = {k: getattr(other, k) for k in defaults.keys()
-                  if k != 'sphinx_field'}
-        for k in defaults.keys():
+        for k, v in defaults.items():
             if k == 'sphinx_field':
                 continue
-            self.assertEqual(result[k], defaults[k])
+            self.assertEqual(getattr(other, k), v)
 
     def tearDown(self):
-        self.spx_queries.__exit__(*sys.exc_info())
-        for query in self.spx_queries.captured_queries:
-            print(query['sql'])
+        if self.spx_queries is not None:
+            self.spx_queries.__exit__(*sys.exc_info())
+            for query in self.spx_queries.captured_queries:
+                print(query['sql'])
+        test_method = getattr(self, self._testMethodName)
+        if getattr(test_method, 'mutates_baseline', False):
+            self.create_baseline()
+        else:
+            # Remove only documents added by test
+            self.delete_documents(range(self._first_id + 1, self.newid()))
 
 
 class SphinxModelTestCase(SphinxModelTestCaseBase):
 
     def testInsertAttributes(self):
-        other = self.reload_object(self.obj)
+        other, meta = self.reload_with_meta(self.obj)
         self.assertObjectEqualsToDefaults(other)
+        self.assertDictEqual(meta, {'total': '1'})
 
     def testSelectByAttrs(self):
         exclude = ['attr_multi', 'attr_multi_64', 'attr_json', 'sphinx_field']
         if self.no_string_compare:
             exclude.extend(['attr_string', 'attr_json'])
-        for key in self.defaults.keys():
-            if key in exclude:
-                continue
-            value = getattr(self.obj, key)
-            try:
-                other = self.model.objects.get(**{key: value})
-            except self.model.DoesNotExist:
-                self.fail("lookup failed for %s = %s" % (key, value))
-            self.assertObjectEqualsToDefaults(other)
-
-    def testExtraWhere(self):
-        qs = list(self.model.objects.extra(select={'const': 0}, where=['const=0']))
-        self.assertEqual(len(qs), 1)
-
-    def testLenOfEmptySet(self):
-        qs = self.model.objects.match("nonexistent")
-        self.assertEqual(qs.count(), 0)
-        self.assertEqual(len(qs[:0]), 0)
+        lookups = {key: getattr(self.obj, key)
+                   for key in self.defaults.keys() if key not in exclude}
+        other = self.get_by_lookups(lookups)
+        self.assertObjectEqualsToDefaults(other)
 
     def testGroupByExtraSelect(self):
         qs = self.model.objects.all()
 
-        column_name = None
-        for fld in self.model._meta.get_fields():
-            if fld.name == 'attr_uint':
-                column_name = fld.db_column
-                break
-
+        column_name = self.model._meta.get_field('attr_uint').column
         qs = qs.extra(
             select={'extra': 'CEIL(%s/3600)' % column_name})
 
@@ -132,8 +270,8 @@ class SphinxModelTestCase(SphinxModelTestCaseBase):
             attr_multi__in=[self.obj.attr_multi[0], 100],
             attr_multi_64__in=[self.obj.attr_multi_64[0], 1]
         )
-        for k, v in multi_lookups.items():
-            other = self.model.objects.get(**{k: v})
+        results = self.parallel_lookups(self.model.objects.get, multi_lookups)
+        for other in results.values():
             self.assertObjectEqualsToDefaults(other)
 
     def testShowMeta(self):
@@ -148,25 +286,22 @@ class SphinxModelTestCase(SphinxModelTestCaseBase):
                    'attr_float', 'docid']
         if self.no_string_compare:
             exclude.extend(['attr_string'])
-        for key in self.defaults.keys():
-            if key in exclude:
-                continue
-            value = getattr(self.obj, key)
-            count = self.model.objects.exclude(**{key: value}).count()
-            self.assertEqual(count, 0)
+        lookups = {key: getattr(self.obj, key)
+                   for key in self.defaults.keys() if key not in exclude}
+        counts = self.parallel_lookups(
+            lambda **kw: self.model.objects.exclude(**kw).count(), lookups)
+        self.assertDictEqual(counts, dict.fromkeys(lookups, 0))
 
     def testExcludeAttrByList(self):
         exclude = ['attr_multi', 'attr_multi_64', 'attr_json', 'sphinx_field',
                    'attr_float', 'docid']
         if self.no_string_compare:
             exclude.extend(['attr_string'])
-        for key in self.defaults.keys():
-            if key in exclude:
-                continue
-            value = getattr(self.obj, key)
-            filter_kwargs = {"%s__in" % key: [value]}
-            count = self.model.objects.exclude(**filter_kwargs).count()
-            self.assertEqual(count, 0)
+        lookups = {"%s__in" % key: [getattr(self.obj, key)]
+                   for key in self.defaults.keys() if key not in exclude}
+        counts = self.parallel_lookups(
+            lambda **kw: self.model.objects.exclude(**kw).count(), lookups)
+        self.assertDictEqual(counts, dict.fromkeys(lookups, 0))
 
     def testNumericAttrLookups(self):
         numeric_lookups = dict(
@@ -175,10 +310,12 @@ class SphinxModelTestCase(SphinxModelTestCaseBase):
             attr_multi__gte=0
         )
 
-        for k, v in numeric_lookups.items():
-            other = self.model.objects.get(**{k: v})
+        results = self.parallel_lookups(self.model.objects.get,
+                                        numeric_lookups)
+        for other in results.values():
             self.assertObjectEqualsToDefaults(other)
 
+    @mutates_baseline
     def testUpdates(self):
         new_values = {
             'attr_uint': 200,
@@ -215,12 +352,13 @@ class SphinxModelTestCase(SphinxModelTestCaseBase):
         other = self.reload_object(self.obj)
         self.assertObjectEqualsToDefaults(other, defaults=new_values)
 
+    @mutates_baseline
     def testBulkUpdate(self):
         qs = self.model.objects.filter(attr_uint=self.defaults['attr_uint'])
         qs.update(attr_bool=not self.defaults['attr_bool'])
-        other = self.reload_object(self.obj)
-        self.assertFalse(other.attr_bool)
+        self.assertFalse(self.reload_field(self.obj, 'attr_bool'))
 
+    @mutates_baseline
     def testDelete(self):
         if self.no_string_compare:
             self.skipTest("searchd version is too low")
@@ -232,15 +370,14 @@ class SphinxModelTestCase(SphinxModelTestCaseBase):
         expected = self.create_multiple_models()
         delete_ids = expected[3:7]
         self.model.objects.filter(id__in=delete_ids).delete()
-        qs = self.model.objects.filter(id__in=delete_ids)
-        self.assertEqual(len(qs), 0)
-        qs = self.model.objects.all().values_list('id', flat=True)
-        self.assertListEqual(list(qs), expected[:3] + expected[7:])
+        ids = list(self.model.objects.all().values_list('id', flat=True))
+        self.assertTrue(set(ids).isdisjoint(delete_ids))
+        self.assertListEqual(ids, expected[:3] + expected[7:])
 
 
     def testDjangoSearch(self):
-        other = self.model.objects.filter(sphinx_field__search="hello")[0]
-        self.assertEqual(other.id, self.obj.id)
+        qs = self.model.objects.filter(sphinx_field__search="hello")
+        self.assertEqual(qs.values_list('id', flat=True)[0], self.obj.id)
 
     def testDjangoSearchMultiple(self):
         list(self.model.objects.filter(sphinx_field__search="@sdfsff 'sdfdf'",
@@ -250,17 +387,12 @@ class SphinxModelTestCase(SphinxModelTestCaseBase):
         exclude = ['attr_multi', 'attr_multi_64', 'attr_json', 'sphinx_field']
         if self.no_string_compare:
             exclude.extend(['attr_string', 'attr_json'])
-        for key in self.defaults.keys():
-            if key in exclude:
-                continue
-            value = getattr(self.obj, key)
-            try:
-                key = '%s__exact' % key
-                other = self.model.objects.get(**{key: value})
-            except self.model.DoesNotExist:
-                self.fail("lookup failed for %s = %s" % (key, value))
-            self.assertObjectEqualsToDefaults(other)
+        lookups = {'%s__exact' % key: getattr(self.obj, key)
+                   for key in self.defaults.keys() if key not in exclude}
+        other = self.get_by_lookups(lookups)
+        self.assertObjectEqualsToDefaults(other)
 
+    @mutates_baseline
     def test64BitNumerics(self):
         new_values = {
             # 32 bit unsigned int
@@ -292,81 +424,47 @@ class SphinxModelTestCase(SphinxModelTestCaseBase):
         qs = list(self.model.objects.all()[2:4])
         self.assertEqual([q.id for q in qs], expected[2:4])
 
-    def create_multiple_models(self):
-        expected = [self.obj.id]
-        for i in range(10):
-            id = self.newid()
-            self.model.objects.create(id=id,
-                                      attr_json={},
-                                      attr_uint=i,
-                                      attr_timestamp=self.now)
-            expected.append(id)
-        return expected
-
     def testExclude(self):
         attr_uint = self.defaults['attr_uint']
         attr_bool = self.defaults['attr_bool']
         not_bool = not attr_bool
 
         # check exclude works
-        qs = list(self.model.objects.exclude(
-            attr_uint=attr_uint, attr_bool=attr_bool))
-        self.assertEqual(len(qs), 0)
+        qs = self.model.objects.exclude(
+            attr_uint=attr_uint, attr_bool=attr_bool)
+        self.assertEqual(qs.count(), 0)
         # check that it's really NOT (a AND b) as in Django documentation
-        qs = list(self.model.objects.exclude(
-            attr_uint=attr_uint, attr_bool=not_bool))
-        self.assertEqual(len(qs), 1)
+        qs = self.model.objects.exclude(
+            attr_uint=attr_uint, attr_bool=not_bool)
+        self.assertEqual(qs.count(), 1)
 
     def testExcludeByList(self):
         attr_multi = self.defaults['attr_multi']
-        qs = list(self.model.objects.exclude(attr_multi__in=attr_multi))
-        self.assertEqual(len(qs), 0)
+        qs = self.model.objects.exclude(attr_multi__in=attr_multi)
+        self.assertEqual(qs.count(), 0)
 
         attr_uint = self.defaults['attr_uint']
-        qs = list(self.model.objects.exclude(attr_uint__in=[attr_uint]))
-        self.assertEqual(len(qs), 0)
+        qs = self.model.objects.exclude(attr_uint__in=[attr_uint])
+        self.assertEqual(qs.count(), 0)
 
     def testNumericIn(self):
         attr_uint = self.defaults['attr_uint']
-        qs = list(self.model.objects.filter(attr_uint__in=[attr_uint]))
-        self.assertEqual(len(qs), 1)
+        qs = self.model.objects.filter(attr_uint__in=[attr_uint])
+        self.assertEqual(qs.count(), 1)
 
     def testMatchClause(self):
-        qs = list(self.model.objects.match("doesnotexistinindex"))
-        self.assertEqual(len(qs), 0)
-        qs = list(self.model.objects.match("hello"))
-        self.assertEqual(len(qs), 1)
-        qs = list(self.model.objects.match("hello").match("world"))
-        self.assertEqual(len(qs), 0)
-
-    def testOptionClause(self):
-        qs = list(self.model.objects.match("hello").options(
-            ranker="expr('sum(lcs*user_weight)*1000+bm25')",
-            field_weights="(sphinx_field=3,other_field=2)",
-            index_weights="(testapp_testindex=2)",
-            sort_method="kbuffer"
-        ))
-        self.assertEqual(len(qs), 1)
+        qs = self.model.objects.match("doesnotexistinindex")
+        self.assertEqual(qs.count(), 0)
+        qs = self.model.objects.match("hello")
+        self.assertEqual(qs.count(), 1)
+        qs = self.model.objects.match("hello").match("world")
+        self.assertEqual(qs.count(), 0)
 
     def testOrderBy(self):
         expected = self.create_multiple_models()
         qs = list(self.model.objects.order_by('-attr_uint'))
         expected = [self.obj.id] + list(reversed(expected[1:]))
         self.assertEqual([q.id for q in qs], expected)
-        list(self.model.objects.order_by())
-
-    def testOrderByRand(self):
-        expected = self.create_multiple_models()
-        query = str(self.model.objects.order_by('?').query)
-        self.assertTrue(query.endswith("ORDER BY RAND()"),
-                        msg="invalid query: %s" % query)
-        result = list(self.model.objects.order_by())
-        self.assertEqual(len(expected), len(result))
-
-        query = str(self.model.objects.order_by('?')[:2].query)
-        self.assertTrue(query.endswith("ORDER BY RAND() LIMIT 2"),
-                        msg="invalid query: %s" % query)
-        list(self.model.objects.order_by())
 
     def testGroupBy(self):
         m1 = self.model.objects.create(id=self.newid(),
@@ -395,14 +493,15 @@ class SphinxModelTestCase(SphinxModelTestCaseBase):
 
     def testSphinxFieldExactExclude(self):
         sphinx_field = self.defaults['sphinx_field']
-        qs = list(self.model.objects.match('hello').exclude(sphinx_field=sphinx_field))
-        self.assertEqual(len(qs), 0)
+        qs = self.model.objects.match('hello').exclude(sphinx_field=sphinx_field)
+        self.assertEqual(qs.count(), 0)
 
     def testCount(self):
         self.create_multiple_models()
         r = self.model.objects.filter(attr_uint__gte=-1).count()
         self.assertEqual(r, 11)
 
+    @mutates_baseline
     def testCastToChar(self):
         if self.no_string_compare:
             self.skipTest("string compare not supported by server")
@@ -414,23 +513,24 @@ class SphinxModelTestCase(SphinxModelTestCaseBase):
 
     def testWorkWithRangeInQ(self):
         self.create_multiple_models()
-        total = len(self.model.objects.all()[:1000])
+        total = self.model.objects.count()
         self.assertGreater(total, 4)
+        q = Q(attr_uint__in=[2, 4, 0])
         # simple Q
-        result = self.model.objects.filter(Q(attr_uint__in=[2, 4, 0]))
+        result = self.model.objects.filter(q)
         self.assertEqual(3, len(result))
         self.assertEqual(0, result[0].attr_uint)
         self.assertEqual(2, result[1].attr_uint)
         self.assertEqual(4, result[2].attr_uint)
 
         # Q with negation
-        result = self.model.objects.filter(~Q(attr_uint__in=[2, 4, 0]))
+        result = self.model.objects.filter(~q)
         self.assertEqual(total - 3, len(result))
         for item in result:
             self.assertNotIn(item.attr_uint, [0, 2, 4])
 
         # Q in exclude
-        result = self.model.objects.exclude(Q(attr_uint__in=[2, 4, 0]))
+        result = self.model.objects.exclude(q)
         self.assertEqual(total - 3, len(result))
         for item in result:
             self.assertNotIn(item.attr_uint, [0, 2, 4])
@@ -444,15 +544,16 @@ class SphinxModelTestCase(SphinxModelTestCaseBase):
         self.assertEqual(2, result[1].attr_uint)
         self.assertEqual(4, result[2].attr_uint)
 
+    @mutates_baseline
     def testMVAWorkWithRangeInQFor(self):
         self.create_multiple_models()
-        items = self.model.objects.all()
+        items = list(self.model.objects.order_by('id'))
         total = len(items)
 
         for i, item in enumerate(items):
             mva_values = [_ + 1 for _ in range(i)]
             item.attr_multi = mva_values
-            item.save()
+        self.replace_objects(items)
 
         # simple Q
         result = self.model.objects.filter(Q(attr_multi__in=[100500, 777]))
@@ -461,15 +562,16 @@ class SphinxModelTestCase(SphinxModelTestCaseBase):
         # all items excepts the first(attr_multi==[])
         result = self.model.objects.filter(Q(attr_multi__in=[1, 3]))
         self.assertEqual(total - 1, len(result))
+        lookup_values = frozenset([1, 3])
         for item in result:
-            self.assertTrue(set([1, 3]) and set(item.attr_multi))
+            self.assertFalse(lookup_values.isdisjoint(item.attr_multi))
 
         # same result
         result = self.model.objects.filter(Q(attr_multi__in=[1, 3, 999]))
         self.assertEqual(total - 1, len(result))
 
         items[0].attr_multi.append(999)
-        items[0].save()
+        items[0].save(update_fields=['attr_multi'])
         # now all items in result
         result = self.model.objects.filter(Q(attr_multi__in=[1, 3, 999]))
 
@@ -515,11 +617,13 @@ class TestModelWithAllDbColumnFields(SphinxModelTestCase):
 class CharPKTestCase(SphinxModelTestCase):
     model = models.CharPKModel
 
-    def get_model_defaults(self):
-        defaults = super(CharPKTestCase, self).get_model_defaults()
+    @classmethod
+    def get_model_defaults(cls):
+        defaults = super(CharPKTestCase, cls).get_model_defaults()
         defaults['docid'] = str(defaults['id'])
         return defaults
 
+    @mutates_baseline
     @expectedFailure
     def testDelete(self):
         """
@@ -529,6 +633,40 @@ class CharPKTestCase(SphinxModelTestCase):
         super(CharPKTestCase, self).testDelete()
 
 
+class SphinxQueryTestCase(SphinxModelTestCaseBase):
+    """ Checks query features not depending on model fields declaration."""
+
+    def testExtraWhere(self):
+        qs = list(self.model.objects.extra(select={'const': 0}, where=['const=0']))
+        self.assertEqual(len(qs), 1)
+
+    def testLenOfEmptySet(self):
+        qs = self.model.objects.match("nonexistent")
+        self.assertEqual(qs.count(), 0)
+        self.assertEqual(len(qs[:0]), 0)
+
+    def testOptionClause(self):
+        qs = self.model.objects.match("hello").options(
+            ranker="expr('sum(lcs*user_weight)*1000+bm25')",
+            field_weights="(sphinx_field=3,other_field=2)",
+            index_weights="(testapp_testindex=2)",
+            sort_method="kbuffer"
+        )
+        self.assertEqual(qs.count(), 1)
+
+    def testOrderByRand(self):
+        expected = self.create_multiple_models()
+        query = str(self.model.objects.order_by('?').query)
+        self.assertTrue(query.endswith("ORDER BY RAND()"),
+                        msg="invalid query: %s" % query)
+        result = list(self.model.objects.order_by())
+        self.assertEqual(len(expected), len(result))
+
+        query = str(self.model.objects.order_by('?')[:2].query)
+        self.assertTrue(query.endswith("ORDER BY RAND() LIMIT 2"),
+                        msg="invalid query: %s" % query)
+
+
 class TestSphinxRouter(SphinxModelTestCaseBase):
     def setUp(self):
         super(TestSphinxRouter, self).setUp()
@@ -557,33 +695,66 @@ class TestSphinxRouter(SphinxModelTestCaseBase):
 class EscapingTestCase(SphinxModelTestCaseBase):
     """ Checks escaping symbols"""
 
-    def setUp(self):
-        super(EscapingTestCase, self).setUp()
-        self.obj.sphinx_field = 'sphinx'
-        self.obj.save()
+    # searchd max_batch_queries default
+    max_batch_queries = 32
 
-    def query(self, text, escape=True):
-        escaped = sphinx_escape(text) if escape else text
+    @classmethod
+    def get_model_defaults(cls):
+        defaults = super(EscapingTestCase, cls).get_model_defaults()
+        defaults['sphinx_field'] = 'sphinx'
+        return defaults
+
+    def escape(self, text):
+        escaped = sphinx_escape(text)
         for c in text:
             self.assertIn(c, escaped)
+        return escaped
+
+    def query(self, text, escape=True):
+        escaped = self.escape(text) if escape else text
         try:
             return list(self.model.objects.match(escaped))
         except ProgrammingError as e:
             self.fail("Escaping text %s with %s failed: %s" %
                       (text, escaped, e.args[1]))
 
+    def count_matches(self, expressions):
+        """ Counts documents matching each expression, sending MATCH queries
+        in multi-statement batches."""
+        counts = []
+        c = connections[settings.SPHINX_DATABASE_NAME].cursor()
+        try:
+            for i in range(0, len(expressions), self.max_batch_queries):
+                statements, params = [], []
+                for expression in expressions[i:i + self.max_batch_queries]:
+                    qs = self.model.objects.match(expression)
+                    sql, args = qs.query.get_compiler(using=qs.db).as_sql()
+                    statements.append(sql)
+                    params.extend(args)
+                c.execute('; '.join(statements), params)
+                counts.append(len(c.fetchall()))
+                while c.nextset():
+                    counts.append(len(c.fetchall()))
+        except ProgrammingError as e:
+            self.fail("Escaped expressions batch failed: %s" % e.args[1])
+        finally:
+            c.close()
+        return counts
+
     def testSphinxCharactersEscaping(self):
         """
         Any sphinxql operator should not match document if escaped properly.
         """
         operators = '=<>()|!@~&/^$\-\'\"\\'
+        expressions = []
         for o in operators:
-            res = self.query("sphinx operators %s" % o)
-            self.assertEqual(len(res), 0)
-            text = sphinx_escape("sphinx operators %s" % o)
-            res = self.query('"%s"/1' % text, escape=False)
-            self.assertEqual(len(res), 1)
+            text = self.escape("sphinx operators %s" % o)
+            # whole text doesn't match, any word matches
+            expressions.extend([text, '"%s"/1' % text])
+        counts = self.count_matches(expressions)
+        self.assertListEqual(counts, [0, 1] * len(operators))
 
+    @mutates_baseline
     def testSphinxKeywordsEscaping(self):
         """
         a SENTENCE b means "a" and "b" in one sentence.